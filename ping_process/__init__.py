@@ -0,0 +1,8 @@
+"""
+Package with the canonical `PingDProcessor`; see
+`ping_process.ping_process` for usage as a script.
+"""
+
+from .ping_process import PingDProcessor
+
+__all__ = ["PingDProcessor"]
@@ -12,13 +12,39 @@ When USR1 signal is received, status is printed to stderr.
 
 """
 
-from datetime import datetime
-import fileinput
+from array import array
+import io
+import os
+import re
 import signal
+import struct
 import sys
 import time
 import argparse
 
+# One pass over the line extracts timestamp, icmp_seq and time= at once.
+# Bytes pattern, so stdin can be read in binary mode without decoding.
+# Seconds and fraction are captured separately: two int parses are cheaper
+# than one general float parse.
+_LINE_RE = re.compile(rb"^\[(\d+)\.(\d+)\].*?icmp_seq=(\d+).*?time=([\d.]+)")
+
+# scale per number of fractional digits ('ping -D' normally prints 6)
+_FRAC_SCALE = (1.0, 1e-1, 1e-2, 1e-3, 1e-4, 1e-5, 1e-6, 1e-7, 1e-8, 1e-9)
+
+# number of roundtrip-time samples kept for rolling statistics
+# (power of two, so the ring index is a cheap bitwise AND)
+_RT_RING_SIZE = 4096
+
+# fixed-size record for --binary-out:
+# timestamp in µs, roundtrip time in ms, icmp_seq, seq gap, flags
+_REC = struct.Struct("<QdIHB")
+
+# flag bits of the binary record
+_FLAG_SLOW = 1    # roundtrip time exceeded max_time_ms
+_FLAG_DUP = 2     # suffix like "(DUP!)" was appended
+_FLAG_MISSED = 4  # gap in the icmp_seq numbers
+_FLAG_ERROR = 8   # line with timestamp but no time= tag (e.g. unreachable)
+
 
 class PingDProcessor:
     """
@@ -47,15 +73,45 @@ class PingDProcessor:
         If icmp_seq differs more more than `allowed_seq_diff` from one line to
         the next, the incident is logged. Default: 1, i.e. every missed ping
         is logged.
+
+    binary_out : file object, optional
+        If given, anomalies are additionally written to this binary file
+        object as fixed-size records (struct format "<QdIHB": timestamp
+        in µs, roundtrip time in ms, icmp_seq, seq gap, flag bits).
     """
 
+    # fixed slots instead of a per-instance __dict__: attribute access in
+    # the per-line hot path goes through a C-level slot lookup
+    __slots__ = (
+        "max_time_ms",
+        "datetime_fmt_string",
+        "heartbeat_interval",
+        "heartbeat_pipe",
+        "_hb_ns",
+        "_hb_interval_ns",
+        "last_ping_timestamp",
+        "last_line",
+        "time_string",
+        "_last_time_bytes",
+        "last_seq",
+        "allowed_seq_diff",
+        "_last_sec",
+        "_last_time_string",
+        "_out_count",
+        "_status_pending",
+        "_rt_ring",
+        "_rt_idx",
+        "binary_out",
+    )
+
     def __init__(
         self,
         max_time_ms=1000,
         datetime_fmt_string=None,
         heartbeat_interval=0,
         heartbeat_pipe=None,
-        allowed_seq_diff=1
+        allowed_seq_diff=1,
+        binary_out=None
     ):
 
         self.max_time_ms = max_time_ms
@@ -64,15 +120,35 @@ class PingDProcessor:
             "%Y-%m-%d %H:%M:%S" if datetime_fmt_string is None else datetime_fmt_string
         )
 
-        # heartbeat
+        # heartbeat, tracked in integer monotonic nanoseconds so it is
+        # immune to system clock jumps
         self.heartbeat_interval = heartbeat_interval
         self.heartbeat_pipe = heartbeat_pipe
-        self.last_timestamp = time.time()
+        self._hb_interval_ns = int(heartbeat_interval * 1e9)
+        self._hb_ns = time.monotonic_ns()
 
-        # last line for status output
-        self.last_line = ""
+        # last line and its raw timestamp for status output
+        self.last_line = b""
+        self.last_ping_timestamp = 0.0
         self.time_string = ""
 
+        # cache for the formatted timestamp (default format has 1 s resolution)
+        self._last_sec = -1
+        self._last_time_string = ""
+        self._last_time_bytes = b""
+
+        # lines printed to the (block buffered) stdout since the last flush
+        self._out_count = 0
+
+        # set by the SIGUSR1 handler, serviced by `run` between blocks
+        self._status_pending = False
+
+        # ring buffer of the last roundtrip times for rolling statistics
+        self._rt_ring = array("f", bytes(4 * _RT_RING_SIZE))
+        self._rt_idx = 0
+
+        self.binary_out = binary_out
+
         self.last_seq = -1
         self.allowed_seq_diff = allowed_seq_diff
 
@@ -82,8 +158,8 @@ class PingDProcessor:
 
         Parameters
         ----------
-        line : str
-            String denoting one line of the output of ping.
+        line : bytes
+            Bytes denoting one line of the output of ping.
 
         Returns
         -------
@@ -108,90 +184,256 @@ class PingDProcessor:
         # store line without newline
         self.last_line = line.rstrip()
 
-        a = line.split(" ")
-        if len(a) == 8:
-            # ordinary ping message has 8 fields. '-D' adds the timestamp as prefix.
-            raise RuntimeError(
-                "Got 8 columns. Maybe you missed -D " 'when calling "ping -D x.x.x.x"'
-            )
-
-        if a[0] != "PING":
+        # single-byte dispatch before any parsing: data lines start with
+        # '[' (the '-D' timestamp), the header with 'P' ("PING ...")
+        first = line[:1]
+        if first == b"P":
             # header line (starting with PING) is of no interest
+            return
+        if first != b"[":
+            if b"icmp_seq=" in line:
+                # ordinary ping message without the '-D' timestamp prefix
+                raise RuntimeError(
+                    "Got no timestamp. Maybe you missed -D " 'when calling "ping -D x.x.x.x"'
+                )
+            sys.stdout.buffer.write(b"Unparseable timestamp: " + self.last_line + b"\n")
+            print('Unparseable timestamp:', self.last_line.decode(errors='replace'),
+                  file=sys.stderr)
+            self._count_output()
 
-            # check for valid timestamp
+            # restart the heartbeat period, stdout was written
+            self._hb_ns = time.monotonic_ns()
+
+            return -1
+
+        m = _LINE_RE.match(line)
+        if m is None:
+            # check for valid timestamp added by '-D' as "[xxx.xxx] " prefix
             try:
-                # strip square brackets from timestamp
-                timestamp = float(a[0][1:-2])
-                
-                # convert time when ping was sent in a human readable format
-                self.time_string = datetime.fromtimestamp(timestamp).strftime(
-                    self.datetime_fmt_string
-                )
+                timestamp = float(line[1:line.find(b"]")])
             except ValueError as ex:
-                print('Unparseable timestamp:', self.last_line)
-                print('Unparseable timestamp:', self.last_line, file=sys.stderr)
-                
-                # store time when stdout was written for next heartbeat
-                self.last_timestamp = timestamp
-                
+                sys.stdout.buffer.write(b"Unparseable timestamp: " + self.last_line + b"\n")
+                print('Unparseable timestamp:', self.last_line.decode(errors='replace'),
+                      file=sys.stderr)
+                self._count_output()
+
+                # restart the heartbeat period, stdout was written
+                self._hb_ns = time.monotonic_ns()
+
                 return -1
 
-            # check for sequence number and roundtrip time
-            try:
-                # get sequence number
-                seq = int(a[5][9:])
+            # No parseable time=xx.x tag, thus assume an error and report it
+            self.last_ping_timestamp = timestamp
+            self._update_time_string(timestamp)
+            sys.stdout.buffer.write(self._last_time_bytes + self.last_line + b"\n")
+            self._count_output()
+            if self.binary_out is not None:
+                self.binary_out.write(
+                    _REC.pack(int(timestamp * 1e6), 0.0, 0, 0, _FLAG_ERROR))
+
+            # restart the heartbeat period, stdout was written
+            self._hb_ns = time.monotonic_ns()
+
+            return 1
+
+        # fast path: timestamp, sequence number and roundtrip time in one scan
+        # (fraction clamped to ns resolution so the scale lookup cannot fail)
+        frac = m.group(2)[:9]
+        timestamp = int(m.group(1)) + int(frac) * _FRAC_SCALE[len(frac)]
+        seq = int(m.group(3))
+        rt_time = float(m.group(4))
+
+        # hot attribute as local: LOAD_FAST instead of LOAD_ATTR per use,
+        # written back once at the end
+        last_seq = self.last_seq
+
+        self.last_ping_timestamp = timestamp
+
+        # record the roundtrip time for rolling statistics
+        self._rt_ring[self._rt_idx & (_RT_RING_SIZE - 1)] = rt_time
+        self._rt_idx += 1
+
+        # anomaly conditions are checked first; the human readable timestamp
+        # is only formatted in the branches that actually print something
+
+        # log too long roundtrip time or unusual suffix like "(DUP!)"
+        if rt_time > self.max_time_ms or b"(" in line[m.end():]:
+
+            self._update_time_string(timestamp)
+            sys.stdout.buffer.write(self._last_time_bytes + self.last_line + b"\n")
+            self._count_output()
+            if self.binary_out is not None:
+                flags = _FLAG_SLOW if rt_time > self.max_time_ms else 0
+                if b"(" in line[m.end():]:
+                    flags |= _FLAG_DUP
+                self.binary_out.write(
+                    _REC.pack(int(timestamp * 1e6), rt_time, seq, 0, flags))
+
+            # restart the heartbeat period, stdout was written
+            self._hb_ns = time.monotonic_ns()
+
+        # check sequence number increment; masking the difference to 16 bit
+        # handles the wrap to 0 after 65535 without extra branching
+        gap = (seq - last_seq) & 0xFFFF
+        if last_seq >= 0 and gap > self.allowed_seq_diff:
+            # missed a ping
+            self._update_time_string(timestamp)
+            sys.stdout.buffer.write(
+                self._last_time_bytes
+                + b"Missed icmp_seq=%d:%d (%d packets)\n" % (last_seq, seq, gap)
+            )
+            self._count_output()
+            if self.binary_out is not None:
+                self.binary_out.write(
+                    _REC.pack(int(timestamp * 1e6), rt_time, seq, gap, _FLAG_MISSED))
 
-                # get roundtrip time
-                rt_time = float(a[7][5:])  # strip "time=" from "time=xx.x"
+            # restart the heartbeat period, stdout was written
+            self._hb_ns = time.monotonic_ns()
 
-            except ValueError as ex:
-                # No parseable time=xx.x tag, thus assume an error and report it
-                print(f"{self.time_string} {self.last_line}")
-                
-                # store time when stdout was written for next heartbeat
-                self.last_timestamp = timestamp
-                
-                return 1
-
-            # log too long roundtrip time or unusual suffix
-            if rt_time > self.max_time_ms or len(a)>9:
-                # len(a)>9 if suffix like (DUP!) was appended
-
-                print(f"{self.time_string} {self.last_line}")
-
-                # store time when stdout was written for next heartbeat
-                self.last_timestamp = timestamp
-
-            # check sequence number increment (wraps to 0 after 65535)
-            if self.last_seq != -1 and seq > (self.last_seq + self.allowed_seq_diff) % 65536:
-                # missed a ping
-                print(f"{self.time_string} Missed icmp_seq={self.last_seq}:{seq} ({seq-self.last_seq} packets)")
-                
-                # store time when stdout was written for next heartbeat
-                self.last_timestamp = timestamp
-
-            # heartbeat message if nothing else happend
-            if (
-                self.last_timestamp
-                and self.heartbeat_interval > 0
-                and timestamp - self.last_timestamp > self.heartbeat_interval
-            ):
-                print(
-                    f"No anomalies found in the last {self.heartbeat_interval} s. "
-                    f"Last input was at {self.time_string}",
-                    file=self.heartbeat_pipe,
-                )
-                self.last_timestamp = time.time()
+        self.last_seq = seq
 
-            self.last_seq=seq
+        return 0
 
-            return 0
+    def _update_time_string(self, timestamp):
+        """
+        Convert the time when a ping was sent to a human readable format.
+        Consecutive pings usually fall into the same second, so the
+        formatted string is reused until the integer second changes.
+        """
+        sec = int(timestamp)
+        if sec != self._last_sec:
+            # time.strftime skips the datetime object allocation of
+            # datetime.fromtimestamp(...).strftime(...)
+            self._last_time_string = time.strftime(
+                self.datetime_fmt_string, time.localtime(sec)
+            )
+            # pre-encoded prefix for the bytes output path
+            self._last_time_bytes = (self._last_time_string + " ").encode()
+            self._last_sec = sec
+        self.time_string = self._last_time_string
+
+    def _heartbeat(self, now_ns):
+        """
+        Print the heartbeat message and restart the heartbeat period.
+        """
+        if self.last_ping_timestamp:
+            self._update_time_string(self.last_ping_timestamp)
+        message = (f"No anomalies found in the last {self.heartbeat_interval} s. "
+                   f"Last input was at {self.time_string}")
+        if self.heartbeat_pipe is None:
+            # keep a single (bytes) output path for stdout
+            sys.stdout.buffer.write(message.encode() + b"\n")
+            sys.stdout.flush()
+        else:
+            print(message, file=self.heartbeat_pipe)
+        self._hb_ns = now_ns
+
+    def _count_output(self):
+        """
+        Account for a line printed to stdout and flush every 64th one.
+        Keeps write() syscalls amortized during output bursts; `run`
+        flushes the remainder at block boundaries.
+        """
+        self._out_count += 1
+        if self._out_count & 63 == 0:
+            sys.stdout.flush()
+
+    def run(self, stream):
+        """
+        Feed every line from a binary stream to `process` until EOF.
+
+        The stream is read in 64 KiB blocks which are split into lines
+        manually; this amortizes one read() call over many lines instead
+        of paying a Python-level readline per packet.
+
+        Parameters
+        ----------
+        stream : binary file object
+            Typically `sys.stdin.buffer.raw`.
+        """
+        process = self.process
+        read = stream.read
+        buf = b""
+        while True:
+            chunk = read(65536)
+            if not chunk:
+                break
+            buf += chunk
+            lines = buf.split(b"\n")
+            buf = lines.pop()
+            for line in lines:
+                process(line)
+
+            # pending output is flushed per block, not per line, so a
+            # burst of anomalies within one block costs one write()
+            if self._out_count:
+                sys.stdout.flush()
+                if self.binary_out is not None:
+                    self.binary_out.flush()
+                self._out_count = 0
+
+            # heartbeat if nothing was written for a while; sampled once
+            # per block, compared in integer nanoseconds
+            if self._hb_interval_ns > 0:
+                now_ns = time.monotonic_ns()
+                if now_ns - self._hb_ns > self._hb_interval_ns:
+                    self._heartbeat(now_ns)
+
+            # status requests are only flagged by the signal handler and
+            # serviced here, outside of async signal context
+            if self._status_pending:
+                self._status_pending = False
+                self.print_status()
+        if buf:
+            # stream ended without a trailing newline
+            process(buf)
+        sys.stdout.flush()
+        if self.binary_out is not None:
+            self.binary_out.flush()
+
+    def request_status(self, signum=None, frame=None):
+        """
+        Signal handler for USR1: only sets a flag; the status is printed
+        by `run` at the next block boundary instead of interrupting
+        `process` mid-line.
+        """
+        self._status_pending = True
 
     def print_status(self):
         """
         Callback for USR1 signal to print status to stderr.
         """
-        print(f'Last line at {self.time_string}: "{self.last_line}"', file=sys.stderr)
+        if self.last_ping_timestamp:
+            self._update_time_string(self.last_ping_timestamp)
+        print(f'Last line at {self.time_string}: "{self.last_line.decode(errors="replace")}"',
+              file=sys.stderr)
+
+        # rolling roundtrip-time statistics over the ring buffer
+        n = min(self._rt_idx, _RT_RING_SIZE)
+        if n:
+            samples = sorted(self._rt_ring[:n])
+            print(f"Roundtrip time of last {n} pings: "
+                  f"min {samples[0]:.1f} ms, "
+                  f"p99 {samples[(99 * n) // 100]:.1f} ms, "
+                  f"max {samples[-1]:.1f} ms",
+                  file=sys.stderr)
+        sys.stdout.flush()
+
+
+def set_realtime(cpu):
+    """
+    Pin the process to a single CPU, switch to the SCHED_FIFO realtime
+    scheduler and lock all memory. Reduces scheduling jitter on the
+    reader side that would otherwise inflate roundtrip times and cause
+    spurious anomaly reports. Requires CAP_SYS_NICE/CAP_IPC_LOCK
+    (typically root).
+    """
+    os.sched_setaffinity(0, {cpu})
+    os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(20))
+
+    import ctypes
+    # 3 = MCL_CURRENT | MCL_FUTURE
+    ctypes.CDLL("libc.so.6", use_errno=True).mlockall(3)
 
 
 def parse_args():
@@ -202,7 +444,7 @@ def parse_args():
             help="Roundtrip times exceeding T will be logged. Default %(default)s")
 
     parser.add_argument("--fmt", type=str, default="%Y-%m-%d %H:%M:%S",
-            help=r"Format for the human readable timestamp passed to the 'datetime' module. "
+            help=r"Format for the human readable timestamp passed to 'time.strftime'. "
             "Default: '%(default)s'")
     parser.add_argument("--heartbeat-interval", type=float, default=0, metavar="H",
             help="If H is greater than 0 and no output was produced within H seconds"
@@ -212,6 +454,19 @@ def parse_args():
             help="If N or more sequence numbers are missing, a corresponding "
             "line will be printed. Default: %(default)s")
 
+    parser.add_argument("--binary-out", type=str, default=None, metavar="FILE",
+            help="Additionally append anomalies to FILE as fixed-size binary "
+            "records (struct format '<QdIHB': timestamp in us, roundtrip "
+            "time in ms, icmp_seq, seq gap, flag bits).")
+
+    parser.add_argument("--realtime", action="store_true",
+            help="Pin this process to one CPU, schedule it with SCHED_FIFO "
+            "and lock its memory to reduce scheduling jitter in the "
+            "measured roundtrip times. Needs elevated privileges.")
+
+    parser.add_argument("--cpu", type=int, default=0, metavar="N",
+            help="CPU to pin to when --realtime is given. Default: %(default)s")
+
     args = parser.parse_args()
 
     return args
@@ -226,16 +481,30 @@ if __name__ == "__main__":
             "This script is supposed to read from " "a pipe and not from user input."
         )
 
+    if args.realtime:
+        try:
+            set_realtime(args.cpu)
+        except PermissionError:
+            print("Insufficient privileges for --realtime, continuing without.",
+                  file=sys.stderr)
+
+    # block buffered stdout (64 KiB) instead of the default line buffering;
+    # PingDProcessor flushes at block boundaries and every 64th line
+    sys.stdout = io.TextIOWrapper(
+        io.BufferedWriter(io.FileIO(sys.stdout.fileno(), "wb", closefd=False),
+                          buffer_size=65536)
+    )
+
     p = PingDProcessor(
         max_time_ms=args.max_time_ms,
         datetime_fmt_string=args.fmt,
         heartbeat_interval=args.heartbeat_interval,
-        allowed_seq_diff=args.allowed_seq_diff
+        allowed_seq_diff=args.allowed_seq_diff,
+        binary_out=(open(args.binary_out, "ab") if args.binary_out else None)
     )
 
     # callback for USR1
-    signal.signal(signal.SIGUSR1, lambda sig, frame: p.print_status())
+    signal.signal(signal.SIGUSR1, p.request_status)
 
-    # read from stdin and pass to PingDProcessor
-    for line in fileinput.input("-"):
-        p.process(line)
+    # read from stdin in binary mode and pass to PingDProcessor
+    p.run(sys.stdin.buffer.raw)